@@ -4,8 +4,10 @@ import objc
 import rumps
 import subprocess
 import threading
+import time
 import sys
 
+from collections import OrderedDict
 from Cocoa import NSObject
 from rumps import MenuItem
 from Foundation import NSLog, NSMakeRect
@@ -25,6 +27,10 @@ from safety.util import (
     RequirementFile as SafetyRequirementFile
 )
 from preference import PreferenceController, PreferenceSetting
+from discovery import get_discovery
+from client import SafetyClient, APIError
+from governor import Governor
+from matcher import get_matcher
 
 __version__ = "0.1"
 
@@ -64,21 +70,121 @@ class UIHelper(NSObject):
         self.add = 0
         return self
 
-    def updateMenuItem_(self, menu_item):
+    def applyMenuUpdates_(self, updates):
         '''
-        Update the menu item
-        :param menu_item  The menu item to be added to menu
+        Apply a batch of menu updates, interpret as Objc selector: applyMenuUpdates:
+        :param updates  A tuple of (app icon, [(action, key, snapshot)]) built by MenuUpdater
         '''
+        icon, changes = updates
+        menu = self._app.menu
         separator_key = 'separator_1'
-        if separator_key not in self._app.menu.keys():
+        if changes and separator_key not in menu:
             # Add separator
-            self._app.menu.insert_before('Preferences', rumps.separator)
+            menu.insert_before('Preferences', rumps.separator)
+
+        for action, key, snapshot in changes:
+            if action == MenuUpdater.REMOVED:
+                if key in menu:
+                    del menu[key]
+                continue
+
+            menu_item, item_icon, children = snapshot
+            menu_item.icon = item_icon
+            if len(menu_item):
+                menu_item.clear()
+            for child, child_icon in children:
+                child.icon = child_icon
+                menu_item.add(child)
+            if key not in menu:
+                # Add directory
+                menu.insert_before(separator_key, menu_item)
+
+        if icon is not None:
+            self._app.icon = icon
+
+
+class MenuUpdater(object):
+    '''
+    Collect the verdict changes of a sync and hand them to the main thread
+    in batches, at most one batch every `interval` seconds.
+    '''
+    ADDED = 'added'
+    CHANGED = 'changed'
+    REMOVED = 'removed'
 
-        if menu_item.key not in self._app.menu.keys():
-            # Add directory
-            self._app.menu.insert_before(separator_key, menu_item)
-        else:
-            self._app.menu.update(menu_item)
+    def __init__(self, app, interval=0.5):
+        self.ui_helper = UIHelper.alloc().initWithApp_(app)
+        self.interval = interval
+        # project path -> verdict shown in the menu
+        self.shown = {}
+        self.pending = OrderedDict()
+        self.icon = None
+        self.last_flush = 0
+        self.lock = threading.Lock()
+
+    def stage(self, project):
+        '''
+        Compare the project verdict with the one shown in the menu,
+        and queue the difference
+        :param project  A checked project, invalid projects are removed from the menu
+        '''
+        with self.lock:
+            key = project.path
+            verdict = project.verdict() if project.is_valid else None
+            shown = self.shown.get(key)
+            if verdict == shown:
+                return
+            if verdict is None:
+                self._queue(key, self.REMOVED, None)
+                del self.shown[key]
+                return
+            action = self.CHANGED if shown is not None else self.ADDED
+            self._queue(key, action, project.snapshot())
+            self.shown[key] = verdict
+
+    def remove(self, path):
+        '''
+        Queue the removal of a project which no longer exists
+        '''
+        with self.lock:
+            if self.shown.pop(path, None) is not None:
+                self._queue(path, self.REMOVED, None)
+
+    def set_icon(self, icon):
+        with self.lock:
+            self.icon = icon
+
+    def _queue(self, key, action, snapshot):
+        previous = self.pending.pop(key, None)
+        if previous is not None:
+            previous_action = previous[0]
+            if previous_action == self.ADDED:
+                if action == self.REMOVED:
+                    # Never made it into the menu
+                    return
+                action = self.ADDED
+            elif previous_action == self.REMOVED and action == self.ADDED:
+                # Still in the menu, rebuild it instead
+                action = self.CHANGED
+        self.pending[key] = (action, snapshot)
+
+    def flush(self, force=False):
+        '''
+        Send the pending changes to the main thread in a single batch
+        :param force  Ignore the rate limit, used at the end of a sync
+        '''
+        with self.lock:
+            if not self.pending and self.icon is None:
+                return
+            now = time.time()
+            if not force and now - self.last_flush < self.interval:
+                return
+            changes = [(action, key, snapshot) for key, (action, snapshot) in self.pending.items()]
+            updates = (self.icon, changes)
+            self.pending = OrderedDict()
+            self.icon = None
+            self.last_flush = now
+        self.ui_helper.pyobjc_performSelectorOnMainThread_withObject_('applyMenuUpdates:', updates)
 
 
 class ICONS:
@@ -87,6 +193,10 @@ class ICONS:
     RED = os.path.join(ROOT, 'icons/red.png')
 
 
+def verdict_icon(insecure):
+    return ICONS.RED if insecure else ICONS.GREEN
+
+
 class RequirementFile(object):
 
     def __init__(self, project, path, requirements):
@@ -101,16 +211,24 @@ class RequirementFile(object):
         )
 
         self.requirements = requirements
+        self.insecure = None
 
     def clicked(self, sender):
         subprocess.call(['open', self.path])
 
     def check(self):
-        vulns = check(self.requirements)
-        if vulns:
-            self.menu_item.icon = ICONS.RED
-        else:
-            self.menu_item.icon = ICONS.GREEN
+        app = self.project.app
+        client = app.client
+        vulns = None
+        if client is not None and app.client_error is None:
+            try:
+                vulns = client.check(self.requirements)
+            except APIError as e:
+                app.client_failed(e)
+        if vulns is None:
+            # No key, or the API failed during this sync: use the free database
+            vulns = check(self.requirements)
+        self.insecure = bool(vulns)
         return vulns
 
 
@@ -121,6 +239,8 @@ class Project(object):
         self.path = path
         self.name = path.split("/")[-1]
         self.insecure = None
+        self.state = None
+        self.candidates = []
 
         self.menu_item = MenuItem(
             self.path,
@@ -130,7 +250,6 @@ class Project(object):
         )
 
         self.requirement_files = None
-        self.ui_helper = UIHelper.alloc().initWithApp_(app)
 
         NSApp.activateIgnoringOtherApps_(True)
 
@@ -142,16 +261,36 @@ class Project(object):
     def needs_check(self):
         return self.insecure is None
 
-    def find_requirement_files(self):
-        def is_likely_a_requirement(path):
-            if "req" in path:
-                if path.endswith(".txt") or path.endswith(".pip"):
-                    return True
+    def scan(self):
+        '''
+        Look for requirement file candidates, the verdict is dropped when
+        anything changed since the last scan
+        :return True if the project changed
+        '''
+        matcher = self.app.matcher
+        candidates, state = self.app.discovery.scan(
+            self.path,
+            lambda path: matcher.match(path, root=self.path),
+        )
+        if state == self.state:
             return False
+        self.state = state
+        self.candidates = candidates
+        self.requirement_files = None
+        self.insecure = None
+        return True
+
+    def find_requirement_files(self):
+        # Files referenced with -r can be candidates too, parse them once
+        parsed = set()
 
         def parse(file_name):
+            if file_name in parsed:
+                return
+            parsed.add(file_name)
             reqs = []
             try:
+                self.app.governor.read(os.path.getsize(file_name))
                 with open(file_name) as fh:
                     for item in read_requirements(fh):
                         if isinstance(item, SafetyPackage):
@@ -168,17 +307,9 @@ class Project(object):
             except:
                 pass
 
-        for item in os.listdir(self.path):
-            full_path = os.path.join(self.path, item)
-            if os.path.isdir(full_path):
-                for item_deep in os.listdir(full_path):
-                    full_path_deep = os.path.join(full_path, item_deep)
-                    if os.path.isfile(full_path_deep) and is_likely_a_requirement(full_path_deep):
-                        for req_file in parse(full_path_deep):
-                            yield req_file
-            elif os.path.isfile(full_path) and is_likely_a_requirement(full_path):
-                for req_file in parse(full_path):
-                    yield req_file
+        for path in self.candidates:
+            for req_file in parse(path):
+                yield req_file
 
     def check(self):
         if self.requirement_files is None:
@@ -190,18 +321,24 @@ class Project(object):
             if vulns:
                 insecure = True
         self.insecure = insecure
-        if insecure:
-            self.menu_item.icon = ICONS.RED
-        else:
-            self.menu_item.icon = ICONS.GREEN
 
-    def add(self):
-        self.menu_item.update(
-            [r.menu_item for r in self.requirement_files]
-        )
+    def verdict(self):
+        '''
+        The comparable result of the last check
+        :return A tuple of (insecure, ((requirement file path, insecure), ...))
+        '''
+        return self.insecure, tuple((r.path, r.insecure) for r in self.requirement_files)
 
-        # self.app.menu.update(self.menu_item)
-        self.ui_helper.pyobjc_performSelectorOnMainThread_withObject_('updateMenuItem:', self.menu_item)
+    def snapshot(self):
+        '''
+        The menu items and icons to be shown, it is applied on the main thread
+        :return A tuple of (menu item, icon, [(requirement file menu item, icon)])
+        '''
+        return (
+            self.menu_item,
+            verdict_icon(self.insecure),
+            [(r.menu_item, verdict_icon(r.insecure)) for r in self.requirement_files],
+        )
 
     def clicked(self, sender):
         subprocess.call(['open', self.path])
@@ -222,10 +359,47 @@ class PyupStatusBarApp(rumps.App):
         )
 
         self.projects = []
+        self.last_sync_stats = None
+        self.client_error = None
+        self.client_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.menu_updater = MenuUpdater(self)
 
         # Load the settings from file
         self.reloadSettings()
 
+    def project_for(self, path):
+        '''
+        Get the known project for the path, a new one is created when
+        the path wasn't seen before
+        '''
+        for project in self.projects:
+            if project.path == path:
+                return project
+        project = Project(self, path)
+        self.projects.append(project)
+        return project
+
+    def client_failed(self, error):
+        '''
+        Stop using the API client for the rest of the sync, the error is logged once
+        '''
+        with self.client_lock:
+            if self.client_error is None:
+                self.client_error = error
+                log('API check failed, using the free database for this sync: {}'.format(error))
+
+    @rumps.clicked('Pause Scanning')
+    def pauseScanning(self, sender):
+        '''
+        Toggle pausing the background scan, a running sync waits at its next checkpoint
+        '''
+        sender.state = not sender.state
+        if sender.state:
+            self.governor.pause()
+        else:
+            self.governor.resume()
+
     @rumps.clicked('Preferences')
     def preferences(self, _):
         if 'prefController' not in self.__dict__:
@@ -248,31 +422,63 @@ class PyupStatusBarApp(rumps.App):
             self.prefController.window().makeKeyAndOrderFront_(self)
 
     def sync(self):
+        # The hourly timer doesn't wait for a paused or throttled sync, only one may run
+        if not self.sync_lock.acquire(False):
+            log('Sync Thread {} skipped, the last sync is still running.'.format(threading.current_thread().name))
+            return
+        try:
+            self._sync()
+        finally:
+            self.sync_lock.release()
+
+    def _sync(self):
         log('Sync Thread {} is about to run...'.format(threading.current_thread().name))
         if self.icon is None:
-            self.icon = ICONS.GRAY
+            self.menu_updater.set_icon(ICONS.GRAY)
+            self.menu_updater.flush(force=True)
         try:
-            insecure = False
+            self.client_error = None
+            if self.client is not None:
+                self.client.begin_sync()
+            governor = self.governor
+            governor.begin()
+            seen = set()
+            changed = []
             for path in self.settings['paths']:
                 for item in os.listdir(path):
                     full_path = os.path.join(path, item)
                     if os.path.isdir(full_path):
-                        project = Project(self, full_path)
+                        governor.checkpoint()
+                        seen.add(full_path)
+                        project = self.project_for(full_path)
                         log("have {}".format(full_path))
-                        if project not in self.projects:
-                            self.projects.append(project)
-                            if project.needs_check:
-                                project.check()
-                                if project.is_valid:
-                                    project.add()
-                                    if project.insecure:
-                                        insecure = True
-            if insecure:
-                self.icon = ICONS.RED
-            else:
-                self.icon = ICONS.GREEN
-
-            log('Sync Thread {} run finished.'.format(threading.current_thread().name))
+                        # Projects without changes keep their last verdict
+                        project.scan()
+                        if project.needs_check:
+                            changed.append(project)
+
+            def check_project(project):
+                project.check()
+                self.menu_updater.stage(project)
+                self.menu_updater.flush()
+
+            governor.run(check_project, changed)
+
+            for project in [p for p in self.projects if p.path not in seen]:
+                self.projects.remove(project)
+                self.menu_updater.remove(project.path)
+
+            insecure = any(p.insecure for p in self.projects if p.is_valid)
+            self.menu_updater.set_icon(verdict_icon(insecure))
+            self.menu_updater.flush(force=True)
+
+            self.last_sync_stats = governor.stats()
+            log('Sync Thread {} run finished in {:.1f}s, throttled for {:.1f}s, paused for {:.1f}s.'.format(
+                threading.current_thread().name,
+                self.last_sync_stats['elapsed'],
+                self.last_sync_stats['throttled'],
+                self.last_sync_stats['paused'],
+            ))
         except:
             import traceback
             traceback.print_exc()
@@ -289,7 +495,30 @@ class PyupStatusBarApp(rumps.App):
             'depth': 1,
             'key': str(settings['api_key']),
             'startup': settings['startup'],
+            'git_discovery': settings['git_discovery'],
         }
+        self.discovery = get_discovery(self.settings['git_discovery'])
+        previous_governor = getattr(self, 'governor', None)
+        self.governor = Governor(
+            files_per_second=settings['scan_files_per_second'],
+            bytes_per_second=settings['scan_bytes_per_second'],
+            cpu_share=settings['scan_cpu_share'],
+            workers=settings['scan_workers'],
+            max_load=settings['scan_max_load'],
+        )
+        if previous_governor is not None:
+            # Keep the pause state, and let the menu item resume a running sync
+            self.governor.running = previous_governor.running
+        self.matcher, error = get_matcher(settings, self.governor)
+        if error is not None:
+            log('Invalid requirement file patterns, using the defaults: {}'.format(error))
+        self.client = None
+        if self.settings['key']:
+            self.client = SafetyClient(
+                self.settings['key'],
+                rate=settings['api_rate_limit'],
+                concurrency=settings['api_concurrency'],
+            )
         log('Setting is reloaed')
 
         # Change the startup setting
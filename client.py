@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from packaging.specifiers import SpecifierSet
+
+API_MIRROR = 'https://pyup.io/api/v1/safety/'
+DB_NAME = 'insecure.json'
+DB_FULL_NAME = 'insecure_full.json'
+
+# Status codes which are worth another try
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class Vulnerability(namedtuple("Vulnerability",
+                               ["name", "spec", "version", "advisory", "vuln_id"])):
+    pass
+
+
+class APIError(Exception):
+    pass
+
+
+class InvalidKeyError(APIError):
+    pass
+
+
+class RateLimiter(object):
+    '''
+    A token bucket which allows `rate` calls per second, with bursts up to `burst` calls.
+    A rate of 0 or less disables the limit.
+    '''
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Block until a call is allowed
+        :return The seconds spent waiting
+        '''
+        if self.rate <= 0:
+            return 0
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class SafetyClient(object):
+    '''
+    A client for the keyed safety API.
+
+    The vulnerability database is fetched once per sync over a pooled
+    session and every requirement file is checked against it, so a sync
+    needs two requests at most no matter how many packages it checks.
+    '''
+    def __init__(self, key, mirror=API_MIRROR, rate=1, concurrency=2,
+                 retries=4, backoff=0.5, max_backoff=30, timeout=10):
+        '''
+        :param key          The API key
+        :param mirror       The base URL of the API, eg a local stub server
+        :param rate         Maximum requests per second, 0 for no limit
+        :param concurrency  Maximum requests in flight, also the connection pool size, at least 1
+        :param retries      Retries for failed requests
+        :param backoff      Base delay in seconds between retries
+        :param max_backoff  Maximum delay in seconds between retries
+        :param timeout      Request timeout in seconds
+        '''
+        self.key = key
+        self.mirror = mirror if mirror.endswith('/') else mirror + '/'
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        concurrency = max(1, int(concurrency))
+        self.rate_limiter = RateLimiter(rate, burst=concurrency)
+        self.slots = threading.BoundedSemaphore(concurrency)
+
+        self.session = requests.Session()
+        self.session.headers['X-Api-Key'] = key
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        # db name -> (event, result), shared by all the checks of a sync
+        self._databases = {}
+
+    def begin_sync(self):
+        '''
+        Drop the databases of the last sync, they are fetched again on demand
+        '''
+        with self.lock:
+            self._databases = {}
+
+    def close(self):
+        self.session.close()
+
+    def _delay(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _get(self, db_name):
+        url = self.mirror + db_name
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            with self.slots:
+                try:
+                    r = self.session.get(url, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = APIError('{} failed: {}'.format(url, e))
+                else:
+                    if r.status_code == 200:
+                        try:
+                            return r.json()
+                        except ValueError as e:
+                            raise APIError('{} returned invalid JSON: {}'.format(url, e))
+                    if r.status_code == 403:
+                        raise InvalidKeyError('The API key was rejected')
+                    if r.status_code not in RETRY_STATUS:
+                        raise APIError('{} returned {}'.format(url, r.status_code))
+                    error = APIError('{} returned {}'.format(url, r.status_code))
+            if attempt >= self.retries:
+                raise error
+            time.sleep(self._delay(attempt))
+            attempt += 1
+
+    def database(self, db_name):
+        '''
+        Get a database, concurrent callers share a single request
+        :param db_name  The database file name
+        :return The database dictionary
+        '''
+        with self.lock:
+            entry = self._databases.get(db_name)
+            owner = entry is None
+            if owner:
+                entry = (threading.Event(), [])
+                self._databases[db_name] = entry
+        done, result = entry
+
+        if owner:
+            try:
+                result.append((self._get(db_name), None))
+            except Exception as e:
+                result.append((None, e))
+                # Let the next caller try again
+                with self.lock:
+                    self._databases.pop(db_name, None)
+            finally:
+                done.set()
+        else:
+            done.wait()
+
+        db, error = result[0]
+        if error is not None:
+            raise error
+        return db
+
+    def check(self, packages):
+        '''
+        Check the packages against the vulnerability database
+        :param packages  A list of safety packages, with key and version
+        :return A list of Vulnerability
+        :raise APIError  If the database can't be fetched, InvalidKeyError if the key is rejected
+        '''
+        db = self.database(DB_NAME)
+        db_full = None
+        vulnerable = []
+        found_ids = set()
+        for pkg in packages:
+            # safety-db uses lowercase names with dashes
+            name = pkg.key.replace('_', '-').lower()
+            for specifier in db.get(name, ()):
+                if not SpecifierSet(specifiers=specifier).contains(pkg.version):
+                    continue
+                if db_full is None:
+                    db_full = self.database(DB_FULL_NAME)
+                for data in db_full.get(name, ()):
+                    if specifier not in data.get('specs', ()):
+                        continue
+                    if data.get('id') not in found_ids:
+                        vulnerable.append(Vulnerability(
+                            name=name,
+                            spec=specifier,
+                            version=pkg.version,
+                            advisory=data.get('advisory'),
+                            vuln_id=data.get('id'),
+                        ))
+                        found_ids.add(data.get('id'))
+        return vulnerable
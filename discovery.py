@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import threading
+
+# Seconds a git command may take before it is killed
+GIT_TIMEOUT = 10
+
+
+class FilesystemDiscovery(object):
+    '''
+    Find requirement file candidates by walking the project directory,
+    the project root and its direct sub directories are visited.
+    '''
+    def candidates(self, path, match):
+        '''
+        Walk the project directory
+        :param path   The project directory
+        :param match  A predicate which decides if a file is a candidate
+        :return A list of candidate file paths
+        '''
+        found = []
+        for item in os.listdir(path):
+            full_path = os.path.join(path, item)
+            if os.path.isdir(full_path):
+                for item_deep in os.listdir(full_path):
+                    full_path_deep = os.path.join(full_path, item_deep)
+                    if os.path.isfile(full_path_deep) and match(full_path_deep):
+                        found.append(full_path_deep)
+            elif os.path.isfile(full_path) and match(full_path):
+                found.append(full_path)
+        return found
+
+    def scan(self, path, match):
+        '''
+        Find the candidates and the state they are in
+        :param path   The project directory
+        :param match  A predicate which decides if a file is a candidate
+        :return A tuple of (candidates, state), state is comparable between scans
+        '''
+        found = self.candidates(path, match)
+        return found, file_state(found)
+
+
+class GitDiscovery(object):
+    '''
+    Find requirement file candidates from the tracked file list of a git
+    checkout, so untracked trees like node_modules or build output are
+    never walked. Like the directory walker, only files in the project
+    root and its direct sub directories are candidates. The tracked file
+    list is only re-read when HEAD or the index changed since the last scan.
+    '''
+    def __init__(self, fallback=None):
+        self.fallback = fallback or FilesystemDiscovery()
+        # project path -> (HEAD, index state, tracked files)
+        self._tracked = {}
+
+    def _git(self, path, *args):
+        '''
+        Run a git command inside the project directory
+        :return The output of the command, None if it failed
+        '''
+        try:
+            process = subprocess.Popen(
+                ('git',) + args,
+                cwd=path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError:
+            # git is not installed
+            return None
+        # Don't let a stuck git hang the sync
+        timer = threading.Timer(GIT_TIMEOUT, process.kill)
+        timer.start()
+        try:
+            out, _ = process.communicate()
+        finally:
+            timer.cancel()
+        if process.returncode != 0:
+            return None
+        if not isinstance(out, str):
+            out = out.decode('utf-8', 'replace')
+        return out
+
+    def head(self, path):
+        '''
+        Get the repository state of the project directory
+        :return A tuple of (HEAD, index state), None if path isn't a git checkout
+        '''
+        git_dir = self._git(path, 'rev-parse', '--git-dir')
+        if git_dir is None:
+            return None
+        git_dir = os.path.join(path, git_dir.strip())
+        # An empty repository has no HEAD yet
+        head = (self._git(path, 'rev-parse', '-q', '--verify', 'HEAD') or '').strip()
+        try:
+            stat = os.stat(os.path.join(git_dir, 'index'))
+            index = (stat.st_mtime, stat.st_size)
+        except OSError:
+            index = None
+        return head, index
+
+    def tracked_files(self, path, head):
+        '''
+        Get the tracked files below the project directory
+        :param path  The project directory
+        :param head  The repository state returned by head()
+        :return A list of absolute file paths
+        '''
+        cached = self._tracked.get(path)
+        if cached is not None and cached[0] == head:
+            return cached[1]
+
+        out = self._git(path, 'ls-files', '-z')
+        if out is None:
+            return None
+        files = [
+            os.path.join(path, name) for name in out.split('\0')
+            # Same depth as the directory walker
+            if name and name.count('/') <= 1
+        ]
+        self._tracked[path] = (head, files)
+        return files
+
+    def scan(self, path, match):
+        '''
+        Find the candidates and the state they are in, non-git directories
+        and directories without tracked files (eg a new project inside a
+        checkout) are handed to the fallback discovery
+        :param path   The project directory
+        :param match  A predicate which decides if a file is a candidate
+        :return A tuple of (candidates, state), state is comparable between scans
+        '''
+        head = self.head(path)
+        files = self.tracked_files(path, head) if head is not None else None
+        if not files:
+            if files is None:
+                self._tracked.pop(path, None)
+            return self.fallback.scan(path, match)
+
+        found = [f for f in files if match(f)]
+        return found, (head, file_state(found))
+
+
+def file_state(paths):
+    '''
+    Get a comparable snapshot of the files, changes when a file is
+    modified, added or removed
+    :param paths  The file paths
+    :return A tuple of (path, mtime, size)
+    '''
+    state = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            state.append((path, stat.st_mtime, stat.st_size))
+        except OSError:
+            state.append((path, None, None))
+    return tuple(state)
+
+
+def find_executable(name):
+    '''
+    :return The full path of the executable on PATH, None if not found
+    '''
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def git_available():
+    '''
+    Check once if a working git is installed. On macOS /usr/bin/git is a
+    shim which asks to install the developer tools on every call when
+    they are missing, so it is only used when xcode-select finds them.
+    :return True if git can be used
+    '''
+    git = find_executable('git')
+    if git is None:
+        return False
+    if sys.platform == 'darwin' and os.path.realpath(git) == '/usr/bin/git':
+        command = ['xcode-select', '-p']
+    else:
+        command = [git, '--version']
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(command, stdout=devnull, stderr=devnull) == 0
+    except OSError:
+        return False
+
+
+def get_discovery(use_git):
+    '''
+    Get the discovery backend, the directory walker is used for the whole
+    session when git isn't available
+    :param use_git  Use the tracked file list of git checkouts
+    :return A discovery instance
+    '''
+    if use_git and git_available():
+        return GitDiscovery()
+    return FilesystemDiscovery()
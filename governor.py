@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+
+class Budget(object):
+    '''
+    A token bucket which refills `rate` units per second. Spending more than
+    is available is allowed, the caller waits until the debt is paid off.
+    A rate of 0 disables the budget.
+    '''
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else self.rate
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def spend(self, amount, factor=1.0):
+        '''
+        Spend from the budget
+        :param amount  The units to spend
+        :param factor  Scale the refill rate, used to slow down under load
+        :return The seconds to wait before continuing
+        '''
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.time()
+            rate = self.rate * factor
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / rate
+
+
+class Governor(object):
+    '''
+    Keep background scans within their resource budgets.
+
+    Scans report every file they read and call checkpoint() between units
+    of work. The governor sleeps when the files or bytes per second budget
+    is spent or when the process uses more than its CPU share, and lowers
+    the budgets while the system is loaded. The wall-clock time spent
+    waiting is reported by stats().
+    '''
+    # Seconds between load samples
+    SAMPLE_INTERVAL = 1.0
+
+    # Scans yield at checkpoints while the budgets are shrunk below this
+    YIELD_FACTOR = 0.5
+
+    # Longest a scan yields to a busy system before it carries on
+    MAX_YIELD = 60.0
+
+    def __init__(self, files_per_second=0, bytes_per_second=0, cpu_share=0,
+                 workers=1, max_load=0):
+        '''
+        :param files_per_second  Files read per second, 0 for no limit
+        :param bytes_per_second  Bytes read per second, 0 for no limit
+        :param cpu_share         Share of a CPU the process may use, eg 0.25, 0 for no limit
+        :param workers           Projects checked in parallel
+        :param max_load          Load average per CPU above which the budgets shrink, 0 to ignore load
+        '''
+        self.files = Budget(files_per_second)
+        self.bytes = Budget(bytes_per_second)
+        self.cpu_share = cpu_share
+        self.workers = max(1, int(workers))
+        self.max_load = max_load
+
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.running.set()
+        self._factor = 1.0
+        self._sampled = 0
+        self.begin()
+
+    def begin(self):
+        '''
+        Start a scan, resets the CPU window and the stats
+        '''
+        with self.lock:
+            self.started = time.time()
+            self.cpu_started = cpu_time()
+            self.throttled = 0.0
+            self.paused = 0.0
+            # Workers waiting right now, and since when at least one is
+            self._waiting = {'throttled': 0, 'paused': 0}
+            self._waiting_since = {}
+
+    def stats(self):
+        '''
+        :return A dictionary with the wall-clock seconds the scan took, and
+                during which at least one worker was throttled or paused
+        '''
+        with self.lock:
+            return {
+                'elapsed': time.time() - self.started,
+                'throttled': self.throttled,
+                'paused': self.paused,
+            }
+
+    def pause(self):
+        '''
+        Let the scan yield at its next checkpoint, until resume() is called
+        '''
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def factor(self):
+        '''
+        How much of the budgets may be used, 1.0 on an idle system
+        '''
+        if not self.max_load:
+            return 1.0
+        now = time.time()
+        with self.lock:
+            if now - self._sampled < self.SAMPLE_INTERVAL:
+                return self._factor
+            self._sampled = now
+            pressure = load_per_cpu() / self.max_load
+            self._factor = 1.0 if pressure <= 1 else max(0.1, 1.0 / pressure)
+            return self._factor
+
+    def _wait_started(self, kind):
+        with self.lock:
+            if not self._waiting[kind]:
+                self._waiting_since[kind] = time.time()
+            self._waiting[kind] += 1
+
+    def _wait_finished(self, kind):
+        with self.lock:
+            self._waiting[kind] -= 1
+            if not self._waiting[kind]:
+                # Overlapping waits of several workers count once
+                waited = time.time() - self._waiting_since.pop(kind)
+                setattr(self, kind, getattr(self, kind) + waited)
+
+    def _sleep(self, seconds):
+        if seconds <= 0:
+            return
+        self._wait_started('throttled')
+        try:
+            time.sleep(seconds)
+        finally:
+            self._wait_finished('throttled')
+
+    def read(self, size):
+        '''
+        Account for a file read by the scan
+        :param size  The size of the file in bytes
+        '''
+        factor = self.factor()
+        self._sleep(max(self.files.spend(1, factor), self.bytes.spend(size, factor)))
+
+    def checkpoint(self):
+        '''
+        Called by the scan between units of work, waits while the scan is
+        paused, the process is over its CPU share or the system is busy
+        '''
+        if not self.running.is_set():
+            self._wait_started('paused')
+            try:
+                self.running.wait()
+            finally:
+                self._wait_finished('paused')
+
+        factor = self.factor()
+        # Yield to a very busy system for a while
+        waited = 0
+        while factor < self.YIELD_FACTOR and waited < self.MAX_YIELD:
+            self._sleep(self.SAMPLE_INTERVAL)
+            waited += self.SAMPLE_INTERVAL
+            factor = self.factor()
+
+        if self.cpu_share:
+            share = self.cpu_share * factor
+            with self.lock:
+                used = cpu_time() - self.cpu_started
+                elapsed = time.time() - self.started
+            # Sleep until the CPU used fits into the share of the time passed
+            self._sleep(used / share - elapsed)
+
+    def run(self, func, items):
+        '''
+        Call func for every item on up to `workers` threads, exceptions
+        raised by func are printed and the remaining items still run
+        :param func   The function to call
+        :param items  The items to pass to func
+        '''
+        def call(item):
+            # A failing item doesn't stop the others
+            self.checkpoint()
+            try:
+                func(item)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+        if self.workers == 1:
+            for item in items:
+                call(item)
+            return
+
+        queue = Queue()
+        for item in items:
+            queue.put(item)
+
+        def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    return
+                call(item)
+
+        threads = [
+            threading.Thread(target=worker, name='SyncWorker-{}'.format(i))
+            for i in range(min(self.workers, queue.qsize()))
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def cpu_time():
+    '''
+    :return The user and system CPU seconds used by the process
+    '''
+    times = os.times()
+    return times[0] + times[1]
+
+
+def load_per_cpu():
+    '''
+    :return The one minute load average divided by the CPU count, 0 when unknown
+    '''
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return 0
+    try:
+        import multiprocessing
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpus = 1
+    return load / cpus
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+
+# Globs match the path below the project directory, a glob without a slash
+# matches the file name. `**` crosses directories, `*` and `?` don't.
+DEFAULT_INCLUDE = (
+    '*requirements*.txt',
+    '*requirements*.in',
+    '*requirements*.pip',
+    '*.pip',
+    'constraints*.txt',
+)
+
+# Candidates which are only included when their content looks like requirements
+DEFAULT_AMBIGUOUS = (
+    '*req*.txt',
+    '*.in',
+    'req*/*.txt',
+    'base.txt',
+    'prod*.txt',
+    'dev*.txt',
+    'test*.txt',
+    'local.txt',
+    'staging.txt',
+)
+
+DEFAULT_EXCLUDE = (
+    'MANIFEST.in',
+    '**/node_modules/**',
+    '**/site-packages/**',
+    '**/.git/**',
+    '**/.tox/**',
+    '**/.nox/**',
+    '**/venv/**',
+    '**/.venv/**',
+    '**/build/**',
+    '**/dist/**',
+)
+
+REQUIREMENT_LINE = re.compile(r'''
+    ^(?:
+        # pip options
+        -[rce]\s+\S+
+      | --(?:requirement|constraint|editable|index-url|extra-index-url|find-links|
+            trusted-host|hash|no-binary|only-binary|pre|no-index)\b.*
+        # name[extras] op version, op version ; markers
+      | (?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)(?:\s*\[[^\]]*\])?
+        (?P<spec>\s*(?:===|==|~=|!=|>=|<=|<|>)\s*[^\s,;\#]+
+            (?:\s*,\s*(?:===|==|~=|!=|>=|<=|<|>)\s*[^\s,;\#]+)*)?
+        (?:\s*;[^\#]*)?(?:\s+--hash=\S+)*(?:\s*\\)?
+        # urls and vcs links
+      | (?:git\+|hg\+|svn\+|bzr\+|https?://|file:)\S+
+    )\s*(?:\#.*)?$
+''', re.X)
+
+
+def glob_to_regex(glob):
+    '''
+    Translate a glob into a regex matching the end of a path
+    :param glob  The glob, eg "requirements/*.txt"
+    :return The regex as string
+    '''
+    i, n = 0, len(glob)
+    out = []
+    while i < n:
+        c = glob[i]
+        if glob.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if glob.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        i += 1
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = glob.find(']', i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                chars = glob[i:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                out.append('[{}]'.format(chars.replace('\\', '\\\\')))
+                i = end + 1
+        else:
+            out.append(re.escape(c))
+    return '(?:^|/){}$'.format(''.join(out))
+
+
+class RequirementMatcher(object):
+    '''
+    Decide if a file is a requirement file.
+
+    The include, ambiguous and exclude globs are compiled into a single
+    regex. User regexes are compiled on their own, so their groups and
+    backreferences keep working, and are searched after the globs of the
+    same kind. Excluded paths never match, included paths always do, and
+    ambiguous paths match when their first `sniff_bytes` bytes look like
+    requirements.
+    '''
+    EXCLUDED, INCLUDED, AMBIGUOUS = 'exclude', 'include', 'ambiguous'
+
+    def __init__(self, include=(), exclude=(), include_regex=(), exclude_regex=(),
+                 sniff_bytes=512, governor=None):
+        '''
+        :param include        Globs to include, added to DEFAULT_INCLUDE
+        :param exclude        Globs to exclude, added to DEFAULT_EXCLUDE
+        :param include_regex  Regexes searched in the path to include
+        :param exclude_regex  Regexes searched in the path to exclude
+        :param sniff_bytes    Bytes read from ambiguous candidates
+        :param governor       The Governor the sniff reads are charged to, optional
+        :raise ValueError     If a glob or regex is invalid
+        '''
+        self.include_regexes = compile_regexes(include_regex)
+        self.exclude_regexes = compile_regexes(exclude_regex)
+
+        groups = (
+            (self.EXCLUDED, DEFAULT_EXCLUDE + tuple(exclude)),
+            (self.INCLUDED, DEFAULT_INCLUDE + tuple(include)),
+            (self.AMBIGUOUS, DEFAULT_AMBIGUOUS),
+        )
+        # Alternatives are tried in order, so excludes win over includes
+        alternatives = [
+            '(?=.*?(?:{}))(?P<{}>)'.format('|'.join(glob_to_regex(g) for g in globs), name)
+            for name, globs in groups
+        ]
+        try:
+            self.regex = re.compile('^(?:{})'.format('|'.join(alternatives)), re.S)
+        except re.error as e:
+            raise ValueError('Invalid glob in {!r}: {}'.format(tuple(include) + tuple(exclude), e))
+        self.sniff_bytes = sniff_bytes
+        self.governor = governor
+        # path -> (mtime, size, looks like requirements)
+        self._sniffed = {}
+
+    def classify(self, path):
+        '''
+        :param path  The path below the project directory
+        :return EXCLUDED, INCLUDED, AMBIGUOUS or None if nothing matched
+        '''
+        m = self.regex.match(path)
+        kind = m.lastgroup if m is not None else None
+        if kind == self.EXCLUDED:
+            return kind
+        if any(r.search(path) for r in self.exclude_regexes):
+            return self.EXCLUDED
+        if kind == self.INCLUDED:
+            return kind
+        if any(r.search(path) for r in self.include_regexes):
+            return self.INCLUDED
+        return kind
+
+    def match(self, path, root=''):
+        '''
+        :param path  The file path
+        :param root  The project directory, patterns match the path below it
+        :return True if the file is a requirement file
+        '''
+        relative = path[len(root):] if root and path.startswith(root) else path
+        kind = self.classify(relative)
+        if kind == self.INCLUDED:
+            return True
+        if kind == self.AMBIGUOUS:
+            return self.sniff(path)
+        return False
+
+    def sniff(self, path):
+        '''
+        Check if the beginning of the file looks like requirements, the
+        result is cached until the file changes
+        :param path  The file path
+        :return True if the file looks like requirements
+        '''
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        cached = self._sniffed.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        if self.governor is not None:
+            self.governor.read(min(stat.st_size, self.sniff_bytes))
+        try:
+            with open(path, 'rb') as fh:
+                sample = fh.read(self.sniff_bytes)
+        except (IOError, OSError):
+            return False
+        result = looks_like_requirements(sample, truncated=len(sample) == self.sniff_bytes)
+        self._sniffed[path] = (stat.st_mtime, stat.st_size, result)
+        return result
+
+
+def compile_regexes(regexes):
+    '''
+    :param regexes  Regexes as strings
+    :return A list of compiled regexes
+    :raise ValueError  If a regex is invalid
+    '''
+    compiled = []
+    for regex in regexes:
+        try:
+            compiled.append(re.compile(regex))
+        except re.error as e:
+            raise ValueError('Invalid regex {!r}: {}'.format(regex, e))
+    return compiled
+
+
+def looks_like_requirements(sample, truncated=False):
+    '''
+    Check if a sample of a file looks like requirements: every line is a
+    requirement, eg an unpinned pip-tools .in file, or a few lines aren't
+    but at least one pins a version or is a pip option
+    :param sample     The first bytes of the file
+    :param truncated  The sample ends in the middle of the file
+    :return True if it looks like requirements
+    '''
+    if b'\0' in sample:
+        return False
+    lines = sample.decode('utf-8', 'replace').splitlines()
+    if truncated and lines:
+        # The last line may be cut off
+        lines = lines[:-1]
+
+    valid = invalid = strong = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = REQUIREMENT_LINE.match(line)
+        if m is None:
+            invalid += 1
+            continue
+        valid += 1
+        if m.group('name') is None or m.group('spec'):
+            strong += 1
+    if not valid:
+        return False
+    if not invalid:
+        return True
+    return strong > 0 and invalid * 4 <= valid
+
+
+def get_matcher(settings, governor=None):
+    '''
+    Build the matcher from the settings, falls back to the defaults when
+    the settings are invalid
+    :param settings  The settings loaded by PreferenceSetting
+    :param governor  The Governor the sniff reads are charged to, optional
+    :return A tuple of (matcher, error message or None)
+    '''
+    try:
+        return RequirementMatcher(
+            include=tuple(settings['requirement_include']),
+            exclude=tuple(settings['requirement_exclude']),
+            include_regex=tuple(settings['requirement_include_regex']),
+            exclude_regex=tuple(settings['requirement_exclude_regex']),
+            governor=governor,
+        ), None
+    except ValueError as e:
+        return RequirementMatcher(governor=governor), str(e)
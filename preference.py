@@ -88,6 +88,18 @@ class PreferenceSetting(NSObject):
             jsonData = NSJSONSerialization.JSONObjectWithData_options_error_(settingFile, 0, None)[0]
             settings['startup'] = jsonData['startup']
             settings['api_key'] = jsonData['api_key']
+            settings['git_discovery'] = jsonData.get('git_discovery', True)
+            settings['api_rate_limit'] = jsonData.get('api_rate_limit', 1)
+            settings['api_concurrency'] = jsonData.get('api_concurrency', 2)
+            settings['scan_files_per_second'] = jsonData.get('scan_files_per_second', 20)
+            settings['scan_bytes_per_second'] = jsonData.get('scan_bytes_per_second', 1024 * 1024)
+            settings['scan_cpu_share'] = jsonData.get('scan_cpu_share', 0.25)
+            settings['scan_workers'] = jsonData.get('scan_workers', 1)
+            settings['scan_max_load'] = jsonData.get('scan_max_load', 1.0)
+            settings['requirement_include'] = jsonData.get('requirement_include', [])
+            settings['requirement_exclude'] = jsonData.get('requirement_exclude', [])
+            settings['requirement_include_regex'] = jsonData.get('requirement_include_regex', [])
+            settings['requirement_exclude_regex'] = jsonData.get('requirement_exclude_regex', [])
             for item in jsonData['paths']:
                 directory = Directory.alloc().initWithDict_(item)
                 paths.addObject_(directory)
@@ -95,6 +107,18 @@ class PreferenceSetting(NSObject):
         else:
             settings['startup'] = True
             settings['api_key'] = ''
+            settings['git_discovery'] = True
+            settings['api_rate_limit'] = 1
+            settings['api_concurrency'] = 2
+            settings['scan_files_per_second'] = 20
+            settings['scan_bytes_per_second'] = 1024 * 1024
+            settings['scan_cpu_share'] = 0.25
+            settings['scan_workers'] = 1
+            settings['scan_max_load'] = 1.0
+            settings['requirement_include'] = []
+            settings['requirement_exclude'] = []
+            settings['requirement_include_regex'] = []
+            settings['requirement_exclude_regex'] = []
             settings['paths'] = paths
         return settings
 